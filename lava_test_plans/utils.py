@@ -9,90 +9,314 @@
 
 import os
 import argparse
+import copy
+import hashlib
+import json
 import logging
+import shutil
 import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from configobj import ConfigObj, ConfigObjError
 from ruamel.yaml import YAML
+from ruamel.yaml.parser import ParserError
+from ruamel.yaml.composer import ComposerError
+from ruamel.yaml.error import YAMLError
+
+from lava_test_plans import __version__
 
 logger = logging.getLogger(__name__)
 
+# Parsed variables files, keyed on absolute path and holding
+# (mtime_ns, size, parsed dict). Kept in LRU order.
+VARIABLES_CACHE_SIZE = 100
+_variables_cache = OrderedDict()
+_variables_cache_lock = threading.Lock()
 
-def generate_audio_clips_url():
+# Device reference variable names, keyed on path and holding
+# (mtime_ns, frozenset of names)
+_ref_variables_cache = {}
+
+
+AUDIO_CLIPS_BUCKET = "qcom-prd-gh-artifacts"
+AUDIO_CLIPS_KEY = "qualcomm-linux/test-media-assets/AudioClips.tar.gz"
+AUDIO_CLIPS_EXPIRES_IN = 196000
+AUDIO_CLIPS_PRESIGN_CMD = (
+    "aws",
+    "s3",
+    "presign",
+    f"s3://{AUDIO_CLIPS_BUCKET}/{AUDIO_CLIPS_KEY}",
+    "--expires-in",
+    str(AUDIO_CLIPS_EXPIRES_IN),
+)
+
+
+@lru_cache(maxsize=None)
+def _s3_client():
+    import boto3
+
+    return boto3.client("s3")
+
+
+@lru_cache(maxsize=None)
+def _aws_path():
+    return shutil.which("aws")
+
+
+def _generate_audio_clips_url_cli():
+    if _aws_path() is None:
+        logger.warning(
+            "AWS CLI not found. Install AWS CLI to enable audio clip support."
+        )
+        return None
 
     try:
         result = subprocess.run(
-            [
-                "aws",
-                "s3",
-                "presign",
-                "s3://qcom-prd-gh-artifacts/qualcomm-linux/test-media-assets/AudioClips.tar.gz",
-                "--expires-in",
-                "196000",
-            ],
+            AUDIO_CLIPS_PRESIGN_CMD,
             capture_output=True,
-            text=True,
             timeout=30,
         )
         if result.returncode == 0:
-            url = result.stdout.strip()
+            # the URL is on the first line, skip decoding anything else
+            url = result.stdout.split(b"\n", 1)[0].decode("ascii").strip()
             logger.info(f"Generated audio clips URL: {url[:80]}...")
             return url
         else:
-            logger.warning(f"Failed to generate audio URL: {result.stderr}")
+            stderr = result.stderr.decode(errors="replace")
+            logger.warning(f"Failed to generate audio URL: {stderr}")
             return None
     except subprocess.TimeoutExpired:
         logger.warning("AWS CLI command timed out while generating audio URL")
         return None
-    except FileNotFoundError:
-        logger.warning(
-            "AWS CLI not found. Install AWS CLI to enable audio clip support."
-        )
+    except Exception as e:
+        logger.warning(f"Error generating audio URL: {e}")
+        return None
+
+
+def generate_audio_clips_url():
+    """
+    Return a presigned URL for the audio clips archive, or None on
+    failure. The URL is signed in-process with boto3, the AWS CLI is
+    used instead when boto3 is not installed or LTP_USE_AWS_CLI is set.
+    """
+    if os.getenv("LTP_USE_AWS_CLI"):
+        return _generate_audio_clips_url_cli()
+
+    try:
+        client = _s3_client()
+    except ImportError:
+        logger.debug("boto3 not found, falling back to AWS CLI")
+        return _generate_audio_clips_url_cli()
+    except Exception as e:
+        logger.warning(f"Error creating S3 client: {e}")
         return None
+
+    try:
+        url = client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": AUDIO_CLIPS_BUCKET, "Key": AUDIO_CLIPS_KEY},
+            ExpiresIn=AUDIO_CLIPS_EXPIRES_IN,
+        )
+        logger.info(f"Generated audio clips URL: {url[:80]}...")
+        return url
     except Exception as e:
         logger.warning(f"Error generating audio URL: {e}")
         return None
 
 
+YAML_SUFFIXES = (".yaml", ".yml")
+
+
+def _parse_yaml(path):
+    with open(path, "r") as vars_file:
+        yaml = YAML(typ="safe")
+        # empty and comment only files load as None
+        data = yaml.load(vars_file) or {}
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a mapping, got {type(data).__name__}")
+    return data
+
+
+def _parse_variables(variables):
+    if variables.endswith(YAML_SUFFIXES):
+        # try YAML first, but files in INI format with a YAML name are
+        # still read by ConfigObj
+        try:
+            return _parse_yaml(variables)
+        except FileNotFoundError:
+            # like ConfigObj, treat a missing file as empty
+            return {}
+        except (YAMLError, ValueError) as yaml_error:
+            try:
+                return ConfigObj(variables).dict()
+            except ConfigObjError as e:
+                logger.error(yaml_error)
+                logger.error(e)
+                return {}
+
+    try:
+        return ConfigObj(variables).dict()
+    except ConfigObjError as e:
+        logger.info(e)
+        logger.info("Unable to parse .ini file")
+        logger.info("Trying YAML")
+    try:
+        return _parse_yaml(variables)
+    except (ParserError, ComposerError, ValueError) as e:
+        logger.error(e)
+    return {}
+
+
+def _json_cache_path(path, cache_dir):
+    """
+    Location of the JSON copy of the (absolute) path in cache_dir.
+    """
+    name = hashlib.sha256(os.fsencode(path)).hexdigest()
+    return os.path.join(cache_dir, f"{name}.json")
+
+
+def _load_cached(path, parse=_parse_variables, st=None):
+    """
+    Return the parsed contents of path. When LTP_JSON_CACHE_DIR is set,
+    a JSON copy kept in that directory is used if it was written by the
+    same lava-test-plans version for the same path, mtime and size.
+    Otherwise path is parsed and the JSON copy refreshed. Variables
+    files may hold credentials, so the copies are only readable by
+    their owner. st is the os.stat() result of path if the caller
+    already has it.
+    """
+    cache_dir = os.getenv("LTP_JSON_CACHE_DIR")
+    if not cache_dir:
+        return parse(path)
+
+    path = os.path.abspath(path)
+    if st is None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return parse(path)
+    source = {
+        "version": __version__,
+        "path": path,
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+    }
+    cache_file = _json_cache_path(path, cache_dir)
+    try:
+        with open(cache_file, "r") as f:
+            cached = json.load(f)
+        if isinstance(cached, dict) and cached.get("source") == source:
+            return cached["data"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    parsed = parse(path)
+    if not parsed:
+        return parsed
+    try:
+        data = json.dumps({"source": source, "data": parsed})
+    except (TypeError, ValueError):
+        return parsed
+    # only keep copies which load back to the same data, YAML types
+    # such as dates or non string keys don't survive the round trip
+    if json.loads(data)["data"] != parsed:
+        return parsed
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        # mkstemp() creates the file with mode 0600
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    except OSError as e:
+        logger.debug(f"Unable to write {cache_file}: {e}")
+        return parsed
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        logger.debug(f"Unable to write {cache_file}: {e}")
+        os.unlink(tmp)
+    return parsed
+
+
+def _load_variables(variables):
+    """
+    Parse a variables file, reusing a previous parse as long as the
+    file's mtime and size are unchanged. A deep copy is returned as
+    callers are free to modify the result.
+    """
+    try:
+        st = os.stat(variables)
+    except OSError:
+        return _parse_variables(variables)
+
+    path = os.path.abspath(variables)
+    with _variables_cache_lock:
+        cached = _variables_cache.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            _variables_cache.move_to_end(path)
+            parsed = cached[2]
+        else:
+            parsed = None
+    if parsed is not None:
+        return copy.deepcopy(parsed)
+
+    parsed = _load_cached(path, st=st)
+    with _variables_cache_lock:
+        _variables_cache[path] = (st.st_mtime_ns, st.st_size, parsed)
+        _variables_cache.move_to_end(path)
+        while len(_variables_cache) > VARIABLES_CACHE_SIZE:
+            _variables_cache.popitem(last=False)
+    return copy.deepcopy(parsed)
+
+
 def get_context(script_dirname, args_variables, args_overwrite_variables):
+    paths = [
+        (
+            variables
+            if os.path.exists(variables)
+            else os.path.join(script_dirname, variables)
+        )
+        for variables in args_variables
+    ]
+    # files are read in parallel but merged in command line order, so
+    # later files still override earlier ones
+    if len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=min(8, len(paths))) as executor:
+            loaded = list(executor.map(_load_variables, paths))
+    else:
+        loaded = [_load_variables(path) for path in paths]
+
     context = {}
-    for variables in args_variables:
-        if not os.path.exists(variables):
-            variables = os.path.join(script_dirname, variables)
-        try:
-            context.update(ConfigObj(variables).dict())
-        except ConfigObjError as e:
-            logger.info(e)
-            logger.info("Unable to parse .ini file")
-            logger.info("Trying YAML")
-            with open(variables, "r") as vars_file:
-                try:
-                    yaml = YAML(typ="safe")
-                    context.update(yaml.load(vars_file))
-                except ParserError as e:
-                    logger.error(e)
-                except ComposerError as e:
-                    logger.error(e)
-
-    for variable in args_overwrite_variables:
-        key, value = variable.split("=")
-        context.update({key: value})
+    for variables in loaded:
+        context.update(variables)
+
+    context.update(variable.split("=", 1) for variable in args_overwrite_variables)
     return context
 
 
+def _load_ref_variables(ref_vars):
+    st = os.stat(ref_vars)
+    cached = _ref_variables_cache.get(ref_vars)
+    if cached is not None and cached[0] == st.st_mtime_ns:
+        return cached[1]
+    names = frozenset(_load_cached(ref_vars, _parse_yaml, st))
+    _ref_variables_cache[ref_vars] = (st.st_mtime_ns, names)
+    return names
+
+
 def validate_variables(
     script_dirname, device_type, device_path, variables, overwrite_variables
 ):
-    context = set(get_context(script_dirname, variables, overwrite_variables).keys())
+    context = get_context(script_dirname, variables, overwrite_variables).keys()
     ref_vars = os.path.join(
         os.path.abspath(os.path.join(script_dirname, device_path)),
         "variables",
         f"{device_type}.yaml",
     )
-    ref_variables = set()
-    with open(ref_vars, "r") as vars_file:
-        yaml = YAML(typ="safe")
-        ref_variables = set(yaml.load(vars_file).keys())
-    var_diff = ref_variables.difference(context)
+    var_diff = _load_ref_variables(ref_vars) - context
     if var_diff:
         logger.error(f"Mandatory variables missing: {var_diff}")
         return 1
@@ -117,20 +341,23 @@ class overlay_action(argparse.Action):
         setattr(namespace, self.dest, pairs)
 
 
-COMPRESSIONS = {
-    ".tar.xz": ("tar", "xz"),
-    ".tar.gz": ("tar", "gz"),
-    ".tgz": ("tar", "gz"),
-    ".gz": (None, "gz"),
-    ".xz": (None, "xz"),
-    ".zst": (None, "zstd"),
-    ".py": ("file", None),
-    ".sh": ("file", None),
-}
+# (suffix, (format, compression)) pairs, longer suffixes first so that
+# e.g. ".tar.gz" wins over ".gz"
+COMPRESSIONS = (
+    (".tar.xz", ("tar", "xz")),
+    (".tar.gz", ("tar", "gz")),
+    (".tgz", ("tar", "gz")),
+    (".zst", (None, "zstd")),
+    (".gz", (None, "gz")),
+    (".xz", (None, "xz")),
+    (".py", ("file", None)),
+    (".sh", ("file", None)),
+)
 
 
+@lru_cache(maxsize=1024)
 def compression(path):
-    for ext, ret in COMPRESSIONS.items():
+    for ext, ret in COMPRESSIONS:
         if path.endswith(ext):
             return ret
     return (None, None)
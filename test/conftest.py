@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# vim: set ts=4
+#
+# Copyright 2023-present Linaro Limited
+#
+# SPDX-License-Identifier: MIT
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def context_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("ctx")
+
+
+@pytest.fixture(scope="session")
+def ini_context_file(context_dir):
+    """INI variables file with a single section"""
+    path = context_dir / "variables.ini"
+    path.write_text("[section]\nkey1 = value1\nkey2 = value2\n")
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def yaml_context_file(context_dir):
+    """Flat YAML variables file"""
+    path = context_dir / "variables.yaml"
+    path.write_text("key1: value1\nkey2: value2\n")
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def ref_vars_dir(tmp_path_factory):
+    """Device path holding reference variables for test-device"""
+    path = tmp_path_factory.mktemp("device")
+    (path / "variables").mkdir()
+    (path / "variables" / "test-device.yaml").write_text("key1: value1\nkey2: value2\n")
+    return str(path)
@@ -8,29 +8,39 @@
 
 import pytest
 import subprocess
-from unittest.mock import patch, MagicMock, mock_open
+from unittest.mock import patch, mock_open
 from lava_test_plans.utils import (
     generate_audio_clips_url,
     get_context,
     validate_variables,
     overlay_action,
     compression,
+    _json_cache_path,
+    _load_cached,
 )
 import argparse
+import json
 import os
-import tempfile
+from pathlib import Path
+from types import SimpleNamespace
 
 
 class TestGenerateAudioClipsUrl:
-    """Test cases for generate_audio_clips_url function"""
+    """Test cases for generate_audio_clips_url function using the AWS CLI"""
+
+    @pytest.fixture(autouse=True)
+    def use_aws_cli(self, monkeypatch):
+        monkeypatch.setenv("LTP_USE_AWS_CLI", "1")
+        monkeypatch.setattr("lava_test_plans.utils._aws_path", lambda: "/usr/bin/aws")
 
     @patch("lava_test_plans.utils.subprocess.run")
     def test_generate_audio_clips_url_success(self, mock_run):
         """Test successful URL generation"""
-        mock_result = MagicMock()
-        mock_result.returncode = 0
-        mock_result.stdout = "https://s3.amazonaws.com/test-url?signature=abc123\n"
-        mock_run.return_value = mock_result
+        mock_run.return_value = SimpleNamespace(
+            returncode=0,
+            stdout=b"https://s3.amazonaws.com/test-url?signature=abc123\n",
+            stderr=b"",
+        )
 
         url = generate_audio_clips_url()
 
@@ -44,10 +54,9 @@ class TestGenerateAudioClipsUrl:
     @patch("lava_test_plans.utils.subprocess.run")
     def test_generate_audio_clips_url_failure(self, mock_run):
         """Test URL generation failure"""
-        mock_result = MagicMock()
-        mock_result.returncode = 1
-        mock_result.stderr = "Error: Invalid credentials"
-        mock_run.return_value = mock_result
+        mock_run.return_value = SimpleNamespace(
+            returncode=1, stdout=b"", stderr=b"Error: Invalid credentials"
+        )
 
         url = generate_audio_clips_url()
 
@@ -63,224 +72,338 @@ class TestGenerateAudioClipsUrl:
         assert url is None
 
     @patch("lava_test_plans.utils.subprocess.run")
-    def test_generate_audio_clips_url_aws_not_found(self, mock_run):
+    @patch("lava_test_plans.utils._aws_path", return_value=None)
+    def test_generate_audio_clips_url_aws_not_found(self, mock_aws_path, mock_run):
         """Test when AWS CLI is not installed"""
-        mock_run.side_effect = FileNotFoundError()
+        assert generate_audio_clips_url() is None
+        mock_run.assert_not_called()
+
+    @patch("lava_test_plans.utils.subprocess.run")
+    def test_generate_audio_clips_url_generic_exception(self, mock_run):
+        """Test generic exception handling"""
+        mock_run.side_effect = Exception("Unexpected error")
 
         url = generate_audio_clips_url()
 
         assert url is None
 
+
+class TestGenerateAudioClipsUrlBoto3:
+    """Test cases for generate_audio_clips_url function using boto3"""
+
+    @pytest.fixture(autouse=True)
+    def no_aws_cli(self, monkeypatch):
+        monkeypatch.delenv("LTP_USE_AWS_CLI", raising=False)
+
     @patch("lava_test_plans.utils.subprocess.run")
-    def test_generate_audio_clips_url_generic_exception(self, mock_run):
-        """Test generic exception handling"""
-        mock_run.side_effect = Exception("Unexpected error")
+    @patch("lava_test_plans.utils._s3_client")
+    def test_generate_audio_clips_url_success(self, mock_client, mock_run):
+        """Test successful URL generation"""
+        mock_client.return_value.generate_presigned_url.return_value = (
+            "https://s3.amazonaws.com/test-url?signature=abc123"
+        )
+
+        url = generate_audio_clips_url()
+
+        assert url == "https://s3.amazonaws.com/test-url?signature=abc123"
+        mock_client.return_value.generate_presigned_url.assert_called_once_with(
+            "get_object",
+            Params={
+                "Bucket": "qcom-prd-gh-artifacts",
+                "Key": "qualcomm-linux/test-media-assets/AudioClips.tar.gz",
+            },
+            ExpiresIn=196000,
+        )
+        mock_run.assert_not_called()
+
+    @patch("lava_test_plans.utils._s3_client")
+    def test_generate_audio_clips_url_failure(self, mock_client):
+        """Test URL generation failure"""
+        mock_client.return_value.generate_presigned_url.side_effect = Exception(
+            "Unable to locate credentials"
+        )
 
         url = generate_audio_clips_url()
 
         assert url is None
 
+    @patch("lava_test_plans.utils.subprocess.run")
+    @patch("lava_test_plans.utils._aws_path", return_value="/usr/bin/aws")
+    @patch("lava_test_plans.utils._s3_client")
+    def test_generate_audio_clips_url_no_boto3(
+        self, mock_client, mock_aws_path, mock_run
+    ):
+        """Test fallback to the AWS CLI when boto3 is not installed"""
+        mock_client.side_effect = ImportError()
+        mock_run.return_value = SimpleNamespace(
+            returncode=0,
+            stdout=b"https://s3.amazonaws.com/test-url?signature=abc123\n",
+            stderr=b"",
+        )
+
+        url = generate_audio_clips_url()
+
+        assert url == "https://s3.amazonaws.com/test-url?signature=abc123"
+        mock_run.assert_called_once()
+
 
 class TestGetContext:
     """Test cases for get_context function"""
 
-    def test_get_context_with_ini_file(self):
+    def test_get_context_with_ini_file(self, ini_context_file):
         """Test get_context with INI file"""
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".ini", delete=False) as f:
-            f.write("[section]\n")
-            f.write("key1 = value1\n")
-            f.write("key2 = value2\n")
-            temp_file = f.name
-
-        try:
-            context = get_context(os.path.dirname(temp_file), [temp_file], [])
-            # ConfigObj returns nested dict with section names
-            assert "section" in context
-            assert context["section"]["key1"] == "value1"
-            assert context["section"]["key2"] == "value2"
-        finally:
-            os.unlink(temp_file)
-
-    def test_get_context_with_yaml_file(self):
+        context = get_context(os.path.dirname(ini_context_file), [ini_context_file], [])
+        # ConfigObj returns nested dict with section names
+        assert "section" in context
+        assert context["section"]["key1"] == "value1"
+        assert context["section"]["key2"] == "value2"
+
+    def test_get_context_with_yaml_file(self, yaml_context_file):
         """Test get_context with YAML file"""
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".yaml", delete=False) as f:
-            f.write("key1: value1\n")
-            f.write("key2: value2\n")
-            temp_file = f.name
-
-        try:
-            context = get_context(os.path.dirname(temp_file), [temp_file], [])
-            assert "key1" in context
-            assert context["key1"] == "value1"
-            assert "key2" in context
-            assert context["key2"] == "value2"
-        finally:
-            os.unlink(temp_file)
-
-    def test_get_context_with_overwrite_variables(self):
-        """Test get_context with overwrite variables"""
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".ini", delete=False) as f:
-            f.write("[section]\n")
-            f.write("key1 = value1\n")
-            temp_file = f.name
+        context = get_context(
+            os.path.dirname(yaml_context_file), [yaml_context_file], []
+        )
+        assert "key1" in context
+        assert context["key1"] == "value1"
+        assert "key2" in context
+        assert context["key2"] == "value2"
+
+    @pytest.mark.parametrize("content", ["", "# comment only\n"])
+    def test_get_context_with_empty_yaml_file(self, tmp_path, content):
+        """Test get_context with an empty or comment only YAML file"""
+        var_file = tmp_path / "variables.yaml"
+        var_file.write_text(content)
+
+        assert get_context(str(tmp_path), [str(var_file)], []) == {}
+
+    def test_get_context_with_ini_format_yaml_file(self, tmp_path):
+        """Test get_context with INI key = value lines in a .yaml file"""
+        var_file = tmp_path / "variables.yaml"
+        var_file.write_text("KEY1 = value1\nKEY2 = value2\n")
+
+        context = get_context(str(tmp_path), [str(var_file)], [])
+        assert context == {"KEY1": "value1", "KEY2": "value2"}
 
-        try:
-            context = get_context(
-                os.path.dirname(temp_file), [temp_file], ["key1=overwritten"]
-            )
-            assert context["key1"] == "overwritten"
-        finally:
-            os.unlink(temp_file)
+    def test_get_context_with_ini_sections_yaml_file(self, tmp_path):
+        """Test get_context with an INI section in a .yaml file"""
+        var_file = tmp_path / "variables.yaml"
+        var_file.write_text("[section]\nkey1 = value1\n")
+
+        context = get_context(str(tmp_path), [str(var_file)], [])
+        assert context == {"section": {"key1": "value1"}}
+
+    def test_get_context_with_missing_yaml_file(self, tmp_path):
+        """Test get_context treats a missing YAML file as empty"""
+        var_file = tmp_path / "missing.yaml"
+
+        assert get_context(str(tmp_path), [str(var_file)], []) == {}
+
+    def test_get_context_with_overwrite_variables(self, ini_context_file):
+        """Test get_context with overwrite variables"""
+        context = get_context(
+            os.path.dirname(ini_context_file), [ini_context_file], ["key1=overwritten"]
+        )
+        assert context["key1"] == "overwritten"
+
+    def test_get_context_with_overwrite_variables_containing_equals(
+        self, ini_context_file
+    ):
+        """Test get_context splits overwrite variables on the first '='"""
+        context = get_context(
+            os.path.dirname(ini_context_file),
+            [ini_context_file],
+            ["key1=value=with=equals"],
+        )
+        assert context["key1"] == "value=with=equals"
+
+    def test_get_context_with_multiple_files(self, tmp_path):
+        """Test get_context merges multiple files in order"""
+        ini_file = tmp_path / "variables.ini"
+        ini_file.write_text("key1 = value1\nkey2 = value2\n")
+        yaml_file = tmp_path / "variables.yaml"
+        yaml_file.write_text("key2: overridden\nkey3: value3\n")
+
+        context = get_context(str(tmp_path), [str(ini_file), str(yaml_file)], [])
+        assert context == {
+            "key1": "value1",
+            "key2": "overridden",
+            "key3": "value3",
+        }
+
+    def test_get_context_cache(self, tmp_path):
+        """Test get_context reuses parses until the file changes"""
+        var_file = tmp_path / "variables.yaml"
+        var_file.write_text("key1: value1\n")
+
+        context = get_context(str(tmp_path), [str(var_file)], [])
+        context["key1"] = "modified"
+        context = get_context(str(tmp_path), [str(var_file)], [])
+        assert context["key1"] == "value1"
+
+        var_file.write_text("key1: changed\n")
+        context = get_context(str(tmp_path), [str(var_file)], [])
+        assert context["key1"] == "changed"
+
+    def test_get_context_cache_mtime_ns(self, tmp_path):
+        """Test get_context notices a same size rewrite 1ns later"""
+        var_file = tmp_path / "variables.yaml"
+        var_file.write_text("key1: value1\n")
+        mtime_ns = var_file.stat().st_mtime_ns
+        assert get_context(str(tmp_path), [str(var_file)], [])["key1"] == "value1"
+
+        var_file.write_text("key1: value2\n")
+        os.utime(var_file, ns=(mtime_ns + 1, mtime_ns + 1))
+        assert get_context(str(tmp_path), [str(var_file)], [])["key1"] == "value2"
+
+    def test_get_context_json_cache(self, tmp_path, monkeypatch):
+        """Test get_context writes and reads a JSON copy in LTP_JSON_CACHE_DIR"""
+        cache_dir = tmp_path / "cache"
+        monkeypatch.setenv("LTP_JSON_CACHE_DIR", str(cache_dir))
+        var_file = tmp_path / "variables.yaml"
+        var_file.write_text("key1: value1\n")
+        cache_file = Path(_json_cache_path(str(var_file), str(cache_dir)))
+
+        context = get_context(str(tmp_path), [str(var_file)], [])
+        assert context["key1"] == "value1"
+        cached = json.loads(cache_file.read_text())
+        assert cached["data"] == {"key1": "value1"}
+        assert cache_file.stat().st_mode & 0o077 == 0
+
+        cached["data"] = {"key1": "from-cache"}
+        cache_file.write_text(json.dumps(cached))
+        assert _load_cached(str(var_file)) == {"key1": "from-cache"}
+
+        cached["source"]["version"] = "0.0.0"
+        cache_file.write_text(json.dumps(cached))
+        assert _load_cached(str(var_file)) == {"key1": "value1"}
+
+    def test_get_context_json_cache_older_replacement(self, tmp_path, monkeypatch):
+        """Test a replacement with an older mtime invalidates the JSON copy"""
+        monkeypatch.setenv("LTP_JSON_CACHE_DIR", str(tmp_path / "cache"))
+        var_file = tmp_path / "variables.yaml"
+        var_file.write_text("key1: new\n")
+        assert _load_cached(str(var_file)) == {"key1": "new"}
+
+        var_file.write_text("key1: restored-old-file\n")
+        os.utime(var_file, (1577836800, 1577836800))
+        context = get_context(str(tmp_path), [str(var_file)], [])
+        assert context["key1"] == "restored-old-file"
+
+    @patch("lava_test_plans.utils.tempfile.mkstemp")
+    def test_get_context_json_cache_disabled(self, mock_mkstemp, tmp_path, monkeypatch):
+        """Test no JSON copy is written unless LTP_JSON_CACHE_DIR is set"""
+        monkeypatch.delenv("LTP_JSON_CACHE_DIR", raising=False)
+        var_file = tmp_path / "variables.yaml"
+        var_file.write_text("key1: value1\n")
+
+        context = get_context(str(tmp_path), [str(var_file)], [])
+        assert context["key1"] == "value1"
+        mock_mkstemp.assert_not_called()
 
 
 class TestValidateVariables:
     """Test cases for validate_variables function"""
 
-    def test_validate_variables_missing(self):
+    def test_validate_variables_missing(self, ini_context_file, ref_vars_dir):
         """Test validate_variables with missing variables"""
-        # Create temporary files for testing
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Create variables file
-            var_file = os.path.join(tmpdir, "variables.ini")
-            with open(var_file, "w") as f:
-                f.write("[section]\n")
-                f.write("key1 = value1\n")
-
-            # Create device path and reference variables
-            device_path = tmpdir
-            variables_dir = os.path.join(device_path, "variables")
-            os.makedirs(variables_dir, exist_ok=True)
-
-            ref_var_file = os.path.join(variables_dir, "test-device.yaml")
-            with open(ref_var_file, "w") as f:
-                f.write("key1: value1\n")
-                f.write("key2: value2\n")  # This key is missing
-
-            result = validate_variables(
-                tmpdir, "test-device", device_path, [var_file], []
-            )
-            assert result == 1  # Should return 1 for missing variables
-
-    def test_validate_variables_all_present(self):
-        """Test validate_variables with all variables present"""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Create variables file with YAML format (no sections)
-            var_file = os.path.join(tmpdir, "variables.yaml")
-            with open(var_file, "w") as f:
-                f.write("key1: value1\n")
-                f.write("key2: value2\n")
-
-            # Create device path and reference variables
-            device_path = tmpdir
-            variables_dir = os.path.join(device_path, "variables")
-            os.makedirs(variables_dir, exist_ok=True)
-
-            ref_var_file = os.path.join(variables_dir, "test-device.yaml")
-            with open(ref_var_file, "w") as f:
-                f.write("key1: value1\n")
-                f.write("key2: value2\n")
-
-            result = validate_variables(
-                tmpdir, "test-device", device_path, [var_file], []
-            )
-            assert result == 0  # Should return 0 for all variables present
-
-
-class TestOverlayAction:
-    """Test cases for overlay_action class"""
-
-    def test_overlay_action_single_argument(self):
-        """Test overlay_action with single argument"""
-        parser = argparse.ArgumentParser()
-        parser.add_argument(
-            "--overlay",
-            action=overlay_action,
-            nargs="+",
-            dest="overlays",
-            default=[],
+        # key1 and key2 are only defined inside [section]
+        result = validate_variables(
+            ref_vars_dir, "test-device", ref_vars_dir, [ini_context_file], []
         )
+        assert result == 1  # Should return 1 for missing variables
 
-        args = parser.parse_args(["--overlay", "http://example.com/overlay.tar.gz"])
-        assert len(args.overlays) == 1
-        assert args.overlays[0] == ["http://example.com/overlay.tar.gz", "/"]
-
-    def test_overlay_action_two_arguments(self):
-        """Test overlay_action with two arguments"""
-        parser = argparse.ArgumentParser()
-        parser.add_argument(
-            "--overlay",
-            action=overlay_action,
-            nargs="+",
-            dest="overlays",
-            default=[],
-        )
-
-        args = parser.parse_args(
-            ["--overlay", "http://example.com/overlay.tar.gz", "/custom/path"]
+    def test_validate_variables_all_present(self, yaml_context_file, ref_vars_dir):
+        """Test validate_variables with all variables present"""
+        result = validate_variables(
+            ref_vars_dir, "test-device", ref_vars_dir, [yaml_context_file], []
         )
-        assert len(args.overlays) == 1
-        assert args.overlays[0] == ["http://example.com/overlay.tar.gz", "/custom/path"]
-
-    def test_overlay_action_multiple_overlays(self):
-        """Test overlay_action with multiple overlays"""
-        parser = argparse.ArgumentParser()
-        parser.add_argument(
-            "--overlay",
-            action=overlay_action,
-            nargs="+",
-            dest="overlays",
-            default=[],
+        assert result == 0  # Should return 0 for all variables present
+
+    def test_validate_variables_reference_changed(self, tmp_path):
+        """Test validate_variables picks up changes to reference variables"""
+        var_file = tmp_path / "variables.yaml"
+        var_file.write_text("key1: value1\n")
+        (tmp_path / "variables").mkdir()
+        ref_var_file = tmp_path / "variables" / "test-device.yaml"
+        ref_var_file.write_text("key1: value1\n")
+
+        result = validate_variables(
+            str(tmp_path), "test-device", str(tmp_path), [str(var_file)], []
         )
+        assert result == 0
+
+        ref_var_file.write_text("key1: value1\nkey2: value2\n")
+        mtime = ref_var_file.stat().st_mtime + 1
+        os.utime(ref_var_file, (mtime, mtime))
 
-        args = parser.parse_args(
+        result = validate_variables(
+            str(tmp_path), "test-device", str(tmp_path), [str(var_file)], []
+        )
+        assert result == 1
+
+
+@pytest.fixture
+def overlay_parser():
+    # overlay_action appends to the default list in place, so every test
+    # needs a parser of its own
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--overlay",
+        action=overlay_action,
+        nargs="+",
+        dest="overlays",
+        default=[],
+    )
+    return parser
+
+
+@pytest.mark.parametrize(
+    "argv,expected",
+    [
+        (
+            ["--overlay", "http://example.com/overlay.tar.gz"],
+            [["http://example.com/overlay.tar.gz", "/"]],
+        ),
+        (
+            ["--overlay", "http://example.com/overlay.tar.gz", "/custom/path"],
+            [["http://example.com/overlay.tar.gz", "/custom/path"]],
+        ),
+        (
             [
                 "--overlay",
                 "http://example.com/overlay1.tar.gz",
                 "--overlay",
                 "http://example.com/overlay2.tar.gz",
                 "/path",
-            ]
-        )
-        assert len(args.overlays) == 2
-        assert args.overlays[0] == ["http://example.com/overlay1.tar.gz", "/"]
-        assert args.overlays[1] == ["http://example.com/overlay2.tar.gz", "/path"]
-
-
-class TestCompression:
-    """Test cases for compression function"""
-
-    def test_compression_tar_xz(self):
-        """Test compression detection for .tar.xz files"""
-        assert compression("file.tar.xz") == ("tar", "xz")
-
-    def test_compression_tar_gz(self):
-        """Test compression detection for .tar.gz files"""
-        assert compression("file.tar.gz") == ("tar", "gz")
-
-    def test_compression_tgz(self):
-        """Test compression detection for .tgz files"""
-        assert compression("file.tgz") == ("tar", "gz")
-
-    def test_compression_gz(self):
-        """Test compression detection for .gz files"""
-        assert compression("file.gz") == (None, "gz")
-
-    def test_compression_xz(self):
-        """Test compression detection for .xz files"""
-        assert compression("file.xz") == (None, "xz")
-
-    def test_compression_zst(self):
-        """Test compression detection for .zst files"""
-        assert compression("file.zst") == (None, "zstd")
-
-    def test_compression_py(self):
-        """Test compression detection for .py files"""
-        assert compression("file.py") == ("file", None)
-
-    def test_compression_sh(self):
-        """Test compression detection for .sh files"""
-        assert compression("file.sh") == ("file", None)
-
-    def test_compression_unknown(self):
-        """Test compression detection for unknown file types"""
-        assert compression("file.unknown") == (None, None)
+            ],
+            [
+                ["http://example.com/overlay1.tar.gz", "/"],
+                ["http://example.com/overlay2.tar.gz", "/path"],
+            ],
+        ),
+    ],
+    ids=["single_argument", "two_arguments", "multiple_overlays"],
+)
+def test_overlay_action(overlay_parser, argv, expected):
+    """Test overlay_action with one or two arguments per overlay"""
+    args = overlay_parser.parse_args(argv)
+    assert args.overlays == expected
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("file.tar.xz", ("tar", "xz")),
+        ("file.tar.gz", ("tar", "gz")),
+        ("file.tgz", ("tar", "gz")),
+        ("file.gz", (None, "gz")),
+        ("file.xz", (None, "xz")),
+        ("file.zst", (None, "zstd")),
+        ("file.py", ("file", None)),
+        ("file.sh", ("file", None)),
+        ("file.unknown", (None, None)),
+    ],
+)
+def test_compression(name, expected):
+    """Test compression detection for each supported file type"""
+    assert compression(name) == expected